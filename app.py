@@ -1,25 +1,50 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import re
 import os
 
-# 環境に応じてコネクターを選択
+DEFAULT_SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/1reQxe-5Bul3daaEsgnzDXptNxX0rNX844jP8RkAnhVQ/edit?gid=0#gid=0"
+DEFAULT_WORKSHEET_NAME = "kodukai-db"
+
+# 環境に応じたコネクターとスプレッドシートの設定は、起動時に1回だけsecretsを見て決める
+# Streamlit Cloud環境の場合はsecretsから、ローカル環境の場合はハードコーディングされたURLを使用
 try:
-    # Streamlit Cloud環境の場合
-    if "gcp_service_account" in st.secrets:
-        from gsheet_connector_cloud import GSheetConnectorCloud as GSheetConnector
+    HAS_CLOUD_SECRETS = "gcp_service_account" in st.secrets
+    if "SPREADSHEET_URL" in st.secrets:
+        SPREADSHEET_URL = st.secrets["SPREADSHEET_URL"]
+        WORKSHEET_NAME = st.secrets.get("WORKSHEET_NAME", DEFAULT_WORKSHEET_NAME)
     else:
-        # ローカル環境の場合
-        from gsheet_connector import GSheetConnector
-except:
-    # ローカル環境用のコネクターを使用
+        SPREADSHEET_URL, WORKSHEET_NAME = DEFAULT_SPREADSHEET_URL, DEFAULT_WORKSHEET_NAME
+except Exception:
+    # secretsが利用できない場合（ローカル環境）
+    HAS_CLOUD_SECRETS = False
+    SPREADSHEET_URL, WORKSHEET_NAME = DEFAULT_SPREADSHEET_URL, DEFAULT_WORKSHEET_NAME
+
+if HAS_CLOUD_SECRETS:
+    # Streamlit Cloud環境の場合
+    from gsheet_connector_cloud import GSheetConnectorCloud as GSheetConnector
+else:
+    # ローカル環境の場合
     from gsheet_connector import GSheetConnector
 
+# numbaがインストールされている場合は、大きなデータの集計にpandasのnumbaエンジンを使う
+try:
+    import numba  # noqa: F401
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# JITコンパイルのコストを上回る行数になった場合のみnumbaエンジンを使う
+NUMBA_MIN_ROWS = 50_000
+# Streamlitはセッションごとに別スレッドで再実行するため、parallel=Trueは使わない
+# （numba標準のworkqueueスレッドレイヤーは複数スレッドからの同時呼び出しでプロセスごと異常終了する）
+NUMBA_ENGINE_KWARGS = {'nogil': True}
+
 # ページ設定
 st.set_page_config(
     page_title="こづかい分析アプリ",
@@ -28,53 +53,380 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 日本語フォント設定（matplotlib用）
-plt.rcParams['font.family'] = ['DejaVu Sans', 'Hiragino Sans', 'Yu Gothic', 'Meiryo', 'Takao', 'IPAexGothic', 'IPAPGothic', 'VL PGothic', 'Noto Sans CJK JP']
+# 金額列の表示形式（数値のままブラウザ側でフォーマットする）
+YEN_COLUMN = st.column_config.NumberColumn(format='¥%.0f')
 
-@st.cache_data(ttl=300)  # 5分間キャッシュ
-def load_data():
-    """データを読み込む"""
+# 分析に使う列（項目・金額・日時・年月）の範囲。これ以外の列は取得しない
+SHEET_RANGE = "A:D"
+# データの再読み込み間隔（秒）
+# 集計・グラフのキャッシュも同じ間隔で破棄し、絞り込み条件やシートの更新ごとのエントリが溜まり続けないようにする
+CACHE_TTL = 300
+
+@st.cache_resource
+def get_connector():
+    """認証済みのコネクターを取得（セッション間で使い回す）"""
     connector = GSheetConnector()
     
-    if connector.connect():
-        # Streamlit Cloud環境の場合はsecretsから、ローカル環境の場合はハードコーディングされたURLを使用
-        try:
-            if "SPREADSHEET_URL" in st.secrets:
-                spreadsheet_url = st.secrets["SPREADSHEET_URL"]
-                worksheet_name = st.secrets.get("WORKSHEET_NAME", "kodukai-db")
-            else:
-                # ローカル環境用のデフォルト値
-                spreadsheet_url = "https://docs.google.com/spreadsheets/d/1reQxe-5Bul3daaEsgnzDXptNxX0rNX844jP8RkAnhVQ/edit?gid=0#gid=0"
-                worksheet_name = "kodukai-db"
-        except:
-            # secretsが利用できない場合（ローカル環境）
-            spreadsheet_url = "https://docs.google.com/spreadsheets/d/1reQxe-5Bul3daaEsgnzDXptNxX0rNX844jP8RkAnhVQ/edit?gid=0#gid=0"
-            worksheet_name = "kodukai-db"
-        
-        if connector.open_spreadsheet(spreadsheet_url):
-            if connector.select_worksheet(worksheet_name):
-                df = connector.get_data_as_dataframe()
-                
-                if not df.empty:
-                    # カラム名を適切に設定
-                    if len(df.columns) >= 4:
-                        df.columns = ['項目', '金額', '日時', '年月']
-                        
-                        # データ型の変換
-                        df['金額'] = pd.to_numeric(df['金額'], errors='coerce')
-                        df['日時'] = pd.to_datetime(df['日時'], errors='coerce')
-                        
-                        # 年月カラム（202311形式）から年と月を抽出
-                        df['年月'] = df['年月'].astype(str).str.zfill(6)  # 6桁に統一
-                        df['年'] = df['年月'].str[:4]
-                        df['月'] = df['年月'].str[4:6]
-                        df['年月表示'] = df['年'] + '年' + df['月'] + '月'  # 表示用
-                        df['年月日'] = df['日時'].dt.date
-                        
-                        return df
+    if not connector.connect():
+        # 例外で抜けることで、接続失敗の結果はキャッシュされない
+        raise ConnectionError("Google Sheets APIに接続できませんでした")
+    
+    return connector
+
+def fetch_raw_data(spreadsheet_url, worksheet_name):
+    """スプレッドシートの生データを取得する"""
+    try:
+        connector = get_connector()
+    except ConnectionError:
+        return pd.DataFrame()
+    
+    if connector.open_spreadsheet(spreadsheet_url):
+        if connector.select_worksheet(worksheet_name):
+            return connector.get_data_as_dataframe(SHEET_RANGE)
     
     return pd.DataFrame()
 
+# スプレッドシートの「日時」で想定される書式（先頭から順に判定）
+DATETIME_FORMATS = [
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+]
+
+def detect_datetime_format(values):
+    """最初の空でない値から日時の書式を判定する（判定できない場合はNone）"""
+    # 全行を文字列処理せず、先頭から最初の空でない値が見つかった時点で打ち切る
+    sample = next((str(value).strip() for value in values if pd.notna(value) and str(value).strip()), None)
+    if sample is None:
+        return None
+    
+    for fmt in DATETIME_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
+def parse_datetimes(values):
+    """日時の文字列を判定した書式で一括変換する（書式が混在している場合は残りの書式で変換し直す）"""
+    fmt = detect_datetime_format(values)
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce', cache=True)
+    
+    # 最初の書式で変換できなかった空でない値だけを対象に、他の書式を順に試す
+    failed = values[parsed.isna()]
+    failed = failed[failed.notna() & failed.astype(str).str.strip().ne('')]
+    for other_fmt in DATETIME_FORMATS:
+        if failed.empty:
+            break
+        if other_fmt == fmt:
+            continue
+        retry = pd.to_datetime(failed, format=other_fmt, errors='coerce', cache=True)
+        parsed[retry.index] = retry
+        failed = failed[retry.isna()]
+    
+    return parsed
+
+def parse_numbers(values):
+    """数値の文字列を数値に変換する（変換できない値は欠損値）"""
+    # get_all_values()/get_values()はシートの表示形式のままの文字列を返すので、
+    # 「#,##0」形式の「1,200」のような桁区切りのカンマを取り除いてから変換する
+    return pd.to_numeric(values.astype(str).str.replace(',', '', regex=False), errors='coerce')
+
+def transform_data(raw_df):
+    """生データを分析用のDataFrameに変換する"""
+    if raw_df.empty or len(raw_df.columns) < 4:
+        return pd.DataFrame()
+    
+    # 分析に使う先頭4カラムだけを残し、カラム名を適切に設定
+    # 全カラムを変換後の列で置き換えるので、元データのコピーは作らない
+    df = raw_df.iloc[:, :4].set_axis(['項目', '金額', '日時', '年月'], axis=1, copy=False)
+    
+    # データ型の変換
+    amount = parse_numbers(df['金額'])
+    # 金額は円単位の整数なので、小数を含まない限りInt32に縮小して集計時のメモリ転送量を減らす
+    # （合計はInt64に昇格して計算されるので、Int32でも桁あふれしない）
+    # 空欄などが無ければto_numericの結果は既に整数型なので、小数の有無の確認は欠損がある場合だけ行う
+    if pd.api.types.is_integer_dtype(amount) or (amount.dropna() % 1 == 0).all():
+        amount = amount.astype('Int32')
+    df['金額'] = amount
+    df['日時'] = parse_datetimes(df['日時'])
+    
+    # 年月カラム（202311形式）を整数化し、順序付きカテゴリ型にする
+    # （カテゴリは整数の昇順なので、groupbyや範囲の絞り込みを整数コード上で行える）
+    # 年・月は必要な箇所で整数演算（// 100, % 100）により求め、列としては持たない
+    # 表示用の「年月表示」は集計後の小さなフレームでのみ ym_display() で作成する
+    ym_int = parse_numbers(df['年月']).astype('Int32')
+    df['年月'] = ym_int.astype(pd.CategoricalDtype(ordered=True))
+    
+    # 項目はカテゴリ型にして、groupbyや検索を整数コード上で行えるようにする
+    # （get_all_values()の値はすべて文字列なので、文字列への変換は不要）
+    df['項目'] = df['項目'].astype('category')
+    
+    # 年月順に一度だけ並べ替えておき、以降のgroupby('年月')はsort=Falseでも年月順になるようにする
+    # （安定ソートなので同じ年月内の並びは元のまま）
+    df = df.sort_values('年月', kind='mergesort').reset_index(drop=True)
+    
+    return df
+
+def ym_display(ym):
+    """年月（202311形式の整数）のSeriesを表示用の「2023年11月」形式に変換"""
+    # 文字列の組み立てはユニークな年月（月数分）に対してだけ行い、各行には対応表で割り当てる
+    labels = {month: format_year_month(month) for month in ym.dropna().unique()}
+    return ym.map(labels)
+
+def format_year_month(ym):
+    """年月（202311形式の整数）を表示用の「2023年11月」形式に変換"""
+    return f"{int(ym) // 100}年{int(ym) % 100:02d}月"
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_month_display_labels(months):
+    """年月のタプルを表示用ラベルのリストに変換（期間選択のselectboxで毎回作り直さないようにキャッシュする）"""
+    return [format_year_month(month) for month in months]
+
+def get_available_months(df):
+    """データに含まれる年月（締め年月）を昇順のリストで取得"""
+    # カテゴリは昇順なので、使われているコードを昇順に取り出せばそのまま年月順になる
+    codes = df['年月'].cat.codes.to_numpy()
+    used = np.bincount(codes[codes >= 0], minlength=len(df['年月'].cat.categories)) > 0
+    return df['年月'].cat.categories[used].tolist()
+
+def slice_by_month_codes(df, start_code, end_code):
+    """年月順に並んだdfから、年月のカテゴリコードがstart_code～end_codeの行を取得"""
+    # 年月が欠損した行（コード-1）は末尾に並んでいるので、同じ幅の符号なし整数として見ると
+    # コード全体が昇順になり、二分探索で範囲の境界を求められる
+    codes = df['年月'].cat.codes.to_numpy()
+    codes = codes.view(f'u{codes.itemsize}')
+    lo = np.searchsorted(codes, start_code, side='left')
+    hi = np.searchsorted(codes, end_code, side='right')
+    return df.iloc[lo:hi]
+
+def get_loaded_months(df):
+    """load_data()で読み込んだ（絞り込み前の）データに含まれる年月を昇順のリストで取得"""
+    # 読み込み時のカテゴリは実際に出現した年月だけから作られるので、行を走査せずにそのまま使える
+    return df['年月'].cat.categories.tolist()
+
+WEEKDAY_NAMES = ['月', '火', '水', '木', '金', '土', '日']
+
+def hash_frame(df):
+    """集計キャッシュ用の軽量なDataFrameハッシュ（集計に使う列と行ラベルのみ）"""
+    # 項目名の修正（例: 「コーヒ」→「コーヒー」）でもキーが変わるように、項目も含める
+    row_hashes = pd.util.hash_pandas_object(df[['項目', '金額', '日時', '年月']], index=True)
+    return len(df), int(row_hashes.sum())
+
+def use_numba_engine(df):
+    """dfの集計にnumbaエンジンを使うかどうか"""
+    return NUMBA_AVAILABLE and len(df) >= NUMBA_MIN_ROWS
+
+def group_amounts_for_numba(df, key):
+    """numbaエンジン用に金額をkey列でグループ化"""
+    # numbaエンジンはnumpyの数値型しか扱えないため、float64に変換して集計する
+    # keyは列名または列名のリスト
+    keys = df[key] if isinstance(key, str) else [df[k] for k in key]
+    return df['金額'].astype('float64').groupby(keys, sort=False, observed=True)
+
+def amount_summary_dtypes(df):
+    """集計結果の総支出・平均支出のdtype"""
+    # numbaエンジンはfloat64、Cythonは金額と同じInt32で合計を返すので（支出回数もint64とInt64で異なる）、
+    # 行数（使うエンジン）によってdtypeが変わらないようにどちらもこのdtypeに揃える
+    # （合計は桁あふれしないようInt64にする）
+    if pd.api.types.is_integer_dtype(df['金額']):
+        return 'Int64', 'Float64'
+    return 'float64', 'float64'
+
+@st.cache_resource(show_spinner=False)
+def warm_up_numba():
+    """numbaエンジンのJITコンパイル（数秒かかる）をプロセスごとに1回だけ先に済ませる"""
+    # コンパイル結果はデータの内容や行数によらず使い回されるので、数行のデータで実行しておけばよい
+    sample = pd.DataFrame({
+        '金額': pd.array([100, 200, 300], dtype='Int32'),
+        '項目': pd.Categorical(['a', 'b', 'a'])
+    })
+    groups = group_amounts_for_numba(sample, '項目')
+    groups.sum(engine='numba', engine_kwargs=NUMBA_ENGINE_KWARGS)
+    groups.mean(engine='numba', engine_kwargs=NUMBA_ENGINE_KWARGS)
+
+def aggregate_amounts(df, key):
+    """金額をkey列ごとに総支出・支出回数・平均支出で集計"""
+    # グルーパーは1回だけ作り、sum/count/meanで使い回す
+    # キーのソートは行わないので、必要に応じて集計後の小さなフレームでソートする
+    if use_numba_engine(df):
+        groups = group_amounts_for_numba(df, key)
+        summary = pd.DataFrame({
+            '総支出': groups.sum(engine='numba', engine_kwargs=NUMBA_ENGINE_KWARGS),
+            '支出回数': groups.count(),
+            '平均支出': groups.mean(engine='numba', engine_kwargs=NUMBA_ENGINE_KWARGS)
+        })
+    else:
+        summary = df.groupby(key, sort=False, observed=True)['金額'].agg(['sum', 'count', 'mean'])
+        summary.columns = ['総支出', '支出回数', '平均支出']
+    
+    sum_dtype, mean_dtype = amount_summary_dtypes(df)
+    summary = summary.astype({'総支出': sum_dtype, '支出回数': 'int64', '平均支出': mean_dtype})
+    return summary.round(2).reset_index()
+
+def to_float(value):
+    """集計値をfloatに変換する（金額はInt32なので、値がない場合の平均はpd.NAになる。それをNaNにする）"""
+    return float('nan') if pd.isna(value) else float(value)
+
+def get_summary_stats(df):
+    """サイドバーのデータ概要に表示する統計値をまとめて取得"""
+    # どれも1回の列走査で済むので、キャッシュせずに直接計算する（hash_frameでキーを作る方が遅い）
+    return {
+        'count': len(df),
+        'total': df['金額'].sum(),
+        'first_date': df['日時'].min(),
+        'last_date': df['日時'].max(),
+        'months': get_available_months(df)
+    }
+
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pd.DataFrame: hash_frame})
+def get_monthly_summary(df):
+    """年月（締め月）別の集計を取得"""
+    # dfは年月順に並んでいるので、集計結果もそのまま年月順になる
+    monthly_summary = aggregate_amounts(df, '年月')
+    monthly_summary['年月表示'] = ym_display(monthly_summary['年月'])
+    return monthly_summary
+
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pd.DataFrame: hash_frame})
+def get_category_summary(df):
+    """項目別の集計を取得（総支出の降順）"""
+    category_summary = aggregate_amounts(df, '項目')
+    return category_summary.sort_values('総支出', ascending=False)
+
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pd.DataFrame: hash_frame})
+def get_month_item_totals(df):
+    """年月×項目の総支出表を取得（行: 年月、列: 項目、支出のない組み合わせは欠損値）"""
+    keys = ['年月', '項目']
+    if use_numba_engine(df):
+        totals = group_amounts_for_numba(df, keys).sum(engine='numba', engine_kwargs=NUMBA_ENGINE_KWARGS)
+    else:
+        totals = df.groupby(keys, sort=False, observed=True)['金額'].sum()
+    # 行数（使うエンジン）によってdtypeが変わらないよう、aggregate_amounts()の総支出と同じdtypeに揃える
+    sum_dtype, _ = amount_summary_dtypes(df)
+    return totals.astype(sum_dtype).unstack('項目')
+
+def get_item_totals(df, months):
+    """指定した年月の項目別総支出を取得（総支出の降順）"""
+    # 全体の集計は1回だけ行い、期間ごとには小さな年月×項目表を切り出して合計する
+    month_item_totals = get_month_item_totals(df)
+    period_totals = month_item_totals[month_item_totals.index.isin(months)]
+    # 期間内に支出のない項目は除く
+    item_totals = period_totals.sum(min_count=1).dropna()
+    return item_totals.sort_values(ascending=False)
+
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pd.DataFrame: hash_frame})
+def get_daily_summary(df):
+    """日別の集計を取得（支出のない日は0円）"""
+    # datetime64のインデックス上で日単位にリサンプリングする（日時が欠損している行は除かれる）
+    daily_amounts = df.set_index('日時')['金額'].resample('D').sum()
+    return daily_amounts.rename_axis('年月日').reset_index()
+
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pd.DataFrame: hash_frame})
+def get_weekday_summary(df):
+    """曜日別の集計を取得（月曜始まり）"""
+    # 曜日番号（0=月曜）で集計し、曜日名は7行の集計結果にだけ付ける
+    dayofweek = df['日時'].dt.dayofweek
+    weekday_totals = df['金額'].groupby(dayofweek).sum().reindex(range(7), fill_value=0)
+    
+    return pd.DataFrame({
+        '曜日': WEEKDAY_NAMES,
+        '金額': weekday_totals.to_numpy()
+    })
+
+# グラフはサマリーが変わらない限り作り直さない（st.cache_dataはコピーを返すので安全に使い回せる）
+@st.cache_data(ttl=CACHE_TTL)
+def build_monthly_figure(monthly_summary):
+    """締め月別総支出（棒）と支出回数（折れ線）を横並びにした1つのグラフを作成"""
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('締め月別総支出', '締め月別支出回数'))
+    fig.add_bar(
+        x=monthly_summary['年月表示'],
+        y=monthly_summary['総支出'],
+        marker=dict(color=monthly_summary['総支出'], colorscale='Blues'),
+        texttemplate='¥%{y:,.0f}',
+        textposition='outside',
+        hovertemplate='%{x}<br>¥%{y:,.0f}<extra></extra>',
+        row=1, col=1
+    )
+    fig.add_scatter(
+        x=monthly_summary['年月表示'],
+        y=monthly_summary['支出回数'],
+        mode='lines+markers+text',
+        texttemplate='%{y}',
+        textposition='top center',
+        hovertemplate='%{x}<br>%{y}回<extra></extra>',
+        row=1, col=2
+    )
+    fig.update_xaxes(tickangle=-45)
+    fig.update_layout(showlegend=False)
+    return fig
+
+@st.cache_data(ttl=CACHE_TTL)
+def build_category_figure(category_summary):
+    """項目別割合（円・上位10項目）と項目別総支出（横棒・上位15項目）を横並びにした1つのグラフを作成"""
+    top_10 = category_summary.head(10)
+    top_15 = category_summary.head(15)
+    fig = make_subplots(
+        rows=1, cols=2,
+        specs=[[{'type': 'domain'}, {'type': 'xy'}]],
+        subplot_titles=('支出項目別割合（上位10項目）', '項目別総支出（上位15項目）')
+    )
+    fig.add_pie(
+        labels=top_10['項目'],
+        values=top_10['総支出'],
+        hovertemplate='%{label}<br>¥%{value:,.0f} (%{percent})<extra></extra>',
+        row=1, col=1
+    )
+    fig.add_bar(
+        x=top_15['総支出'],
+        y=top_15['項目'],
+        orientation='h',
+        marker=dict(color=top_15['総支出'], colorscale='Reds'),
+        hovertemplate='%{y}<br>¥%{x:,.0f}<extra></extra>',
+        showlegend=False,
+        row=1, col=2
+    )
+    fig.update_yaxes(categoryorder='total ascending', row=1, col=2)
+    return fig
+
+@st.cache_data(ttl=CACHE_TTL)
+def build_time_figure(daily_summary, weekday_summary):
+    """日別支出推移（折れ線）と曜日別支出（棒）を上下に並べた1つのグラフを作成"""
+    fig = make_subplots(rows=2, cols=1, subplot_titles=('日別支出推移', '曜日別支出'), vertical_spacing=0.12)
+    # 日別は点数が多くなるためWebGLで描画
+    fig.add_trace(go.Scattergl(
+        x=daily_summary['年月日'],
+        y=daily_summary['金額'],
+        mode='lines+markers',
+        hovertemplate='%{x|%Y-%m-%d}<br>¥%{y:,.0f}<extra></extra>'
+    ), row=1, col=1)
+    fig.add_bar(
+        x=weekday_summary['曜日'],
+        y=weekday_summary['金額'],
+        marker=dict(color=weekday_summary['金額'], colorscale='Greens'),
+        hovertemplate='%{x}<br>¥%{y:,.0f}<extra></extra>',
+        row=2, col=1
+    )
+    fig.update_xaxes(title_text='年月日', row=1, col=1)
+    fig.update_yaxes(title_text='金額', row=1, col=1)
+    fig.update_yaxes(title_text='金額', row=2, col=1)
+    fig.update_layout(height=800, showlegend=False)
+    return fig
+
+# 読み込んだDataFrameはcache_dataのように毎回ハッシュ化・コピーせず、同じオブジェクトを使い回す
+# （以降の処理はdfを書き換えないので共有しても安全）
+@st.cache_resource(ttl=CACHE_TTL, show_spinner="データを読み込み中...")
+def load_data(spreadsheet_url, worksheet_name):
+    """データを読み込む"""
+    df = transform_data(fetch_raw_data(spreadsheet_url, worksheet_name))
+    # numbaエンジンを使う大きさのデータなら、最初のタブ表示を待たせないよう読み込み中にJITコンパイルを済ませる
+    if use_numba_engine(df):
+        warm_up_numba()
+    return df
+
 def create_period_selector(df):
     """期間選択ウィジェットを作成"""
     if df.empty:
@@ -94,8 +446,8 @@ def create_period_selector(df):
     
     elif period_type == "年月範囲指定":
         # 利用可能な年月を取得
-        available_months = sorted(df['年月'].unique())
-        available_display = [f"{month[:4]}年{month[4:6]}月" for month in available_months]
+        available_months = get_loaded_months(df)
+        available_display = get_month_display_labels(tuple(available_months))
         
         col1, col2 = st.sidebar.columns(2)
         
@@ -117,9 +469,8 @@ def create_period_selector(df):
             )
         
         if start_idx <= end_idx:
-            start_month = available_months[start_idx]
-            end_month = available_months[end_idx]
-            filtered_df = df[(df['年月'] >= start_month) & (df['年月'] <= end_month)]
+            # available_monthsは年月のカテゴリそのものなので、インデックスがカテゴリコードになる
+            filtered_df = slice_by_month_codes(df, start_idx, end_idx)
             
             st.sidebar.success(f"選択期間: {available_display[start_idx]} ～ {available_display[end_idx]}")
             return filtered_df
@@ -153,11 +504,10 @@ def create_period_selector(df):
             )
         
         if start_date <= end_date:
-            # 日付でフィルタリング
-            filtered_df = df[
-                (df['日時'].dt.date >= start_date) & 
-                (df['日時'].dt.date <= end_date)
-            ]
+            # 日付でフィルタリング（datetime64のまま比較するため、終了日は翌日0時未満として扱う）
+            start_ts = pd.Timestamp(start_date)
+            end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            filtered_df = df[(df['日時'] >= start_ts) & (df['日時'] < end_ts)]
             
             st.sidebar.success(f"選択期間: {start_date} ～ {end_date}")
             return filtered_df
@@ -166,7 +516,7 @@ def create_period_selector(df):
             return df
     
     elif period_type == "最近N ヶ月":
-        available_months = sorted(df['年月'].unique())
+        available_months = get_loaded_months(df)
         
         n_months = st.sidebar.slider(
             "最近何ヶ月分を表示",
@@ -176,8 +526,7 @@ def create_period_selector(df):
             key="n_months"
         )
         
-        recent_months = available_months[-n_months:]
-        filtered_df = df[df['年月'].isin(recent_months)]
+        filtered_df = slice_by_month_codes(df, len(available_months) - n_months, len(available_months) - 1)
         
         st.sidebar.success(f"最近{n_months}ヶ月分を表示中")
         return filtered_df
@@ -194,72 +543,42 @@ def create_monthly_analysis(df):
         return
     
     # 年月（締め月）別集計
-    monthly_summary = df.groupby(['年月', '年月表示']).agg({
-        '金額': ['sum', 'count', 'mean']
-    }).round(2)
-    
-    monthly_summary.columns = ['総支出', '支出回数', '平均支出']
-    monthly_summary = monthly_summary.reset_index()
-    
-    # 年月でソート
-    monthly_summary = monthly_summary.sort_values('年月')
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # 月別総支出のグラフ
-        fig = px.bar(
-            monthly_summary, 
-            x='年月表示', 
-            y='総支出',
-            title='締め月別総支出',
-            color='総支出',
-            color_continuous_scale='Blues',
-            text='総支出'
-        )
-        fig.update_layout(xaxis_tickangle=-45)
-        fig.update_traces(texttemplate='¥%{text:,.0f}', textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
+    monthly_summary = get_monthly_summary(df)
     
-    with col2:
-        # 月別支出回数のグラフ
-        fig = px.line(
-            monthly_summary, 
-            x='年月表示', 
-            y='支出回数',
-            title='締め月別支出回数',
-            markers=True,
-            text='支出回数'
-        )
-        fig.update_layout(xaxis_tickangle=-45)
-        fig.update_traces(textposition='top center')
-        st.plotly_chart(fig, use_container_width=True)
+    # 月別総支出・支出回数のグラフ
+    fig = build_monthly_figure(monthly_summary)
+    st.plotly_chart(fig, use_container_width=True, key="monthly_chart")
     
     # 統計サマリー
     st.subheader("📈 締め月別統計サマリー")
     
     # 表示用のデータフレームを作成
-    display_summary = monthly_summary.copy()
-    display_summary['総支出'] = display_summary['総支出'].apply(lambda x: f"¥{x:,.0f}")
-    display_summary['平均支出'] = display_summary['平均支出'].apply(lambda x: f"¥{x:,.0f}")
-    display_summary = display_summary[['年月表示', '総支出', '支出回数', '平均支出']]
-    
-    st.dataframe(display_summary, use_container_width=True)
+    display_summary = monthly_summary[['年月表示', '総支出', '支出回数', '平均支出']]
+    
+    st.dataframe(
+        display_summary,
+        use_container_width=True,
+        column_config={
+            '総支出': YEN_COLUMN,
+            '平均支出': YEN_COLUMN
+        }
+    )
     
     # 追加統計情報
+    stats = monthly_summary['総支出'].agg(['mean', 'max', 'min'])
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.metric("総期間", f"{len(monthly_summary)} ヶ月")
     
     with col2:
-        st.metric("月平均支出", f"¥{monthly_summary['総支出'].mean():,.0f}")
+        st.metric("月平均支出", f"¥{stats['mean']:,.0f}")
     
     with col3:
-        st.metric("最高月支出", f"¥{monthly_summary['総支出'].max():,.0f}")
+        st.metric("最高月支出", f"¥{stats['max']:,.0f}")
     
     with col4:
-        st.metric("最低月支出", f"¥{monthly_summary['総支出'].min():,.0f}")
+        st.metric("最低月支出", f"¥{stats['min']:,.0f}")
 
 def create_category_analysis(df):
     """カテゴリ別分析"""
@@ -270,40 +589,11 @@ def create_category_analysis(df):
         return
     
     # 項目別集計
-    category_summary = df.groupby('項目').agg({
-        '金額': ['sum', 'count', 'mean']
-    }).round(2)
+    category_summary = get_category_summary(df)
     
-    category_summary.columns = ['総支出', '支出回数', '平均支出']
-    category_summary = category_summary.reset_index().sort_values('総支出', ascending=False)
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # 上位10項目の円グラフ
-        top_10 = category_summary.head(10)
-        fig = px.pie(
-            top_10, 
-            values='総支出', 
-            names='項目',
-            title='支出項目別割合（上位10項目）'
-        )
-        st.plotly_chart(fig, use_container_width=True)
-    
-    with col2:
-        # 上位15項目の棒グラフ
-        top_15 = category_summary.head(15)
-        fig = px.bar(
-            top_15, 
-            x='総支出', 
-            y='項目',
-            orientation='h',
-            title='項目別総支出（上位15項目）',
-            color='総支出',
-            color_continuous_scale='Reds'
-        )
-        fig.update_layout(yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig, use_container_width=True)
+    # 上位10項目の円グラフと上位15項目の棒グラフ
+    fig = build_category_figure(category_summary)
+    st.plotly_chart(fig, use_container_width=True, key="category_chart")
     
     # 全項目の統計
     st.subheader("📊 全項目統計")
@@ -317,12 +607,19 @@ def create_search_analysis(df):
         st.error("データが読み込まれていません")
         return
     
-    # 検索フォーム
-    search_term = st.text_input("検索したい項目名を入力してください（部分一致）", "")
+    # 検索フォーム（入力中は再実行せず、検索ボタンの押下時にだけ反映する）
+    with st.form("search_form"):
+        search_term = st.text_input("検索したい項目名を入力してください（部分一致）", "")
+        st.form_submit_button("検索")
     
     if search_term:
-        # 検索実行
-        filtered_df = df[df['項目'].str.contains(search_term, case=False, na=False)]
+        # 検索実行（行ではなくユニークな項目名に対して部分一致を判定）
+        # 入力は正規表現ではなく文字列としてそのまま検索する
+        pattern = re.compile(re.escape(search_term), re.IGNORECASE)
+        categories = df['項目'].cat.categories
+        matching_codes = [code for code, cat in enumerate(categories) if pattern.search(cat)]
+        # 行の絞り込みはカテゴリの整数コード同士の比較で行う
+        filtered_df = df[np.isin(df['項目'].cat.codes.to_numpy(), matching_codes)]
         
         if not filtered_df.empty:
             st.success(f"'{search_term}' を含む項目が {len(filtered_df)} 件見つかりました")
@@ -337,11 +634,11 @@ def create_search_analysis(df):
                 st.metric("支出回数", f"{len(filtered_df)} 回")
             
             with col3:
-                st.metric("平均支出", f"¥{filtered_df['金額'].mean():.0f}")
+                st.metric("平均支出", f"¥{to_float(filtered_df['金額'].mean()):.0f}")
             
             # 月別推移（締め年月基準）
-            monthly_search = filtered_df.groupby(['年月', '年月表示'])['金額'].sum().reset_index()
-            monthly_search = monthly_search.sort_values('年月')
+            monthly_search = filtered_df.groupby('年月', sort=False, observed=True)['金額'].sum().reset_index()
+            monthly_search['年月表示'] = ym_display(monthly_search['年月'])
             
             if len(monthly_search) > 1:
                 fig = px.line(
@@ -349,19 +646,22 @@ def create_search_analysis(df):
                     x='年月表示', 
                     y='金額',
                     title=f"'{search_term}' の締め月別支出推移",
-                    markers=True,
-                    text='金額'
+                    markers=True
                 )
                 fig.update_layout(xaxis_tickangle=-45)
-                fig.update_traces(texttemplate='¥%{text:,.0f}', textposition='top center')
-                st.plotly_chart(fig, use_container_width=True)
+                fig.update_traces(
+                    mode='lines+markers+text',
+                    texttemplate='¥%{y:,.0f}',
+                    textposition='top center',
+                    hovertemplate='%{x}<br>¥%{y:,.0f}<extra></extra>'
+                )
+                st.plotly_chart(fig, use_container_width=True, key="search_monthly_chart")
             
             # 詳細データ
             st.subheader("🔍 検索結果詳細")
-            display_df = filtered_df[['項目', '金額', '日時', '年月表示']].copy()
-            display_df['金額'] = display_df['金額'].apply(lambda x: f"¥{x:,.0f}")
+            display_df = filtered_df[['項目', '金額', '日時']].assign(年月表示=ym_display(filtered_df['年月']))
             display_df = display_df.sort_values('日時', ascending=False)
-            st.dataframe(display_df, use_container_width=True)
+            st.dataframe(display_df, use_container_width=True, column_config={'金額': YEN_COLUMN})
         else:
             st.warning(f"'{search_term}' を含む項目は見つかりませんでした")
 
@@ -374,8 +674,8 @@ def create_period_comparison(df):
         return
     
     # 利用可能な年月を取得
-    available_months = sorted(df['年月'].unique())
-    available_display = [f"{month[:4]}年{month[4:6]}月" for month in available_months]
+    available_months = get_loaded_months(df)
+    available_display = get_month_display_labels(tuple(available_months))
     
     if len(available_months) < 2:
         st.warning("期間比較には最低2ヶ月分のデータが必要です")
@@ -427,24 +727,26 @@ def create_period_comparison(df):
         b_months = available_months[b_start_idx:b_end_idx+1]
         df_b = df[df['年月'].isin(b_months)]
         
-        # 比較統計
+        # 比較統計（各期間の合計・平均・件数を1回の集計でまとめて求める）
+        stats_a = df_a['金額'].agg(['sum', 'mean', 'size'])
+        stats_b = df_b['金額'].agg(['sum', 'mean', 'size'])
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            total_a = df_a['金額'].sum()
-            total_b = df_b['金額'].sum()
+            total_a = stats_a['sum']
+            total_b = stats_b['sum']
             diff = total_b - total_a
             diff_pct = ((total_b - total_a) / total_a * 100) if total_a > 0 else 0
             
             st.metric(
                 "総支出比較",
-                f"¥{total_b:,}",
-                f"¥{diff:+,} ({diff_pct:+.1f}%)"
+                f"¥{total_b:,.0f}",
+                f"¥{diff:+,.0f} ({diff_pct:+.1f}%)"
             )
         
         with col2:
-            avg_a = df_a['金額'].mean()
-            avg_b = df_b['金額'].mean()
+            avg_a = to_float(stats_a['mean'])
+            avg_b = to_float(stats_b['mean'])
             avg_diff = avg_b - avg_a
             avg_diff_pct = ((avg_b - avg_a) / avg_a * 100) if avg_a > 0 else 0
             
@@ -455,8 +757,8 @@ def create_period_comparison(df):
             )
         
         with col3:
-            count_a = len(df_a)
-            count_b = len(df_b)
+            count_a = int(stats_a['size'])
+            count_b = int(stats_b['size'])
             count_diff = count_b - count_a
             count_diff_pct = ((count_b - count_a) / count_a * 100) if count_a > 0 else 0
             
@@ -470,33 +772,30 @@ def create_period_comparison(df):
         st.subheader("項目別支出比較（上位10項目）")
         
         # 期間Aの項目別集計
-        cat_a = df_a.groupby('項目')['金額'].sum().sort_values(ascending=False).head(10)
+        cat_a = get_item_totals(df, a_months).head(10)
         # 期間Bの項目別集計
-        cat_b = df_b.groupby('項目')['金額'].sum().sort_values(ascending=False).head(10)
+        cat_b = get_item_totals(df, b_months).head(10)
         
-        # 共通項目を取得
-        common_items = set(cat_a.index) & set(cat_b.index)
+        # 共通項目だけを残して期間A・Bを横に並べる
+        label_a = f'期間A ({available_display[a_start_idx]}～{available_display[a_end_idx]})'
+        label_b = f'期間B ({available_display[b_start_idx]}～{available_display[b_end_idx]})'
+        comparison_df = pd.concat([cat_a.rename(label_a), cat_b.rename(label_b)], axis=1, join='inner')
         
-        if common_items:
-            comparison_data = []
-            for item in common_items:
-                comparison_data.append({
-                    '項目': item,
-                    f'期間A ({available_display[a_start_idx]}～{available_display[a_end_idx]})': cat_a.get(item, 0),
-                    f'期間B ({available_display[b_start_idx]}～{available_display[b_end_idx]})': cat_b.get(item, 0),
-                    '差額': cat_b.get(item, 0) - cat_a.get(item, 0)
-                })
-            
-            comparison_df = pd.DataFrame(comparison_data)
+        if not comparison_df.empty:
+            comparison_df['差額'] = comparison_df[label_b] - comparison_df[label_a]
             comparison_df = comparison_df.sort_values('差額', key=abs, ascending=False)
+            comparison_df = comparison_df.rename_axis('項目').reset_index()
             
-            # 表示用にフォーマット
-            display_df = comparison_df.copy()
-            for col in display_df.columns[1:]:
-                if col != '項目':
-                    display_df[col] = display_df[col].apply(lambda x: f"¥{x:,.0f}")
-            
-            st.dataframe(display_df, use_container_width=True)
+            # 金額列は数値のまま渡し、表示形式はcolumn_configで指定する
+            st.dataframe(
+                comparison_df,
+                use_container_width=True,
+                column_config={
+                    label_a: YEN_COLUMN,
+                    label_b: YEN_COLUMN,
+                    '差額': YEN_COLUMN
+                }
+            )
         else:
             st.info("選択した期間に共通する項目がありません")
     
@@ -512,38 +811,14 @@ def create_time_analysis(df):
         return
     
     # 日別集計
-    daily_summary = df.groupby('年月日')['金額'].sum().reset_index()
-    daily_summary['年月日'] = pd.to_datetime(daily_summary['年月日'])
-    
-    # 日別支出の推移
-    fig = px.line(
-        daily_summary, 
-        x='年月日', 
-        y='金額',
-        title='日別支出推移',
-        markers=True
-    )
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # 曜日別分析
-    df_with_weekday = df.copy()
-    df_with_weekday['曜日'] = df_with_weekday['日時'].dt.day_name()
-    weekday_summary = df_with_weekday.groupby('曜日')['金額'].sum().reset_index()
-    
-    # 曜日の順序を設定
-    weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    weekday_summary['曜日'] = pd.Categorical(weekday_summary['曜日'], categories=weekday_order, ordered=True)
-    weekday_summary = weekday_summary.sort_values('曜日')
-    
-    fig = px.bar(
-        weekday_summary, 
-        x='曜日', 
-        y='金額',
-        title='曜日別支出',
-        color='金額',
-        color_continuous_scale='Greens'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    daily_summary = get_daily_summary(df)
+    
+    # 曜日別集計
+    weekday_summary = get_weekday_summary(df)
+    
+    # 日別支出の推移と曜日別支出
+    fig = build_time_figure(daily_summary, weekday_summary)
+    st.plotly_chart(fig, use_container_width=True, key="time_chart")
 
 def main():
     """メイン関数"""
@@ -551,8 +826,7 @@ def main():
     st.markdown("---")
     
     # データ読み込み
-    with st.spinner("データを読み込み中..."):
-        df = load_data()
+    df = load_data(SPREADSHEET_URL, WORKSHEET_NAME)
     
     if df.empty:
         st.error("データの読み込みに失敗しました。認証ファイルとスプレッドシートの設定を確認してください。")
@@ -566,19 +840,20 @@ def main():
     
     # フィルタ後のデータ概要
     st.sidebar.subheader("📈 データ概要")
-    st.sidebar.write(f"総データ数: {len(filtered_df):,} 件")
-    st.sidebar.write(f"総支出額: ¥{filtered_df['金額'].sum():,}")
+    stats = get_summary_stats(filtered_df)
+    st.sidebar.write(f"総データ数: {stats['count']:,} 件")
+    st.sidebar.write(f"総支出額: ¥{stats['total']:,}")
     
-    if not filtered_df.empty:
-        st.sidebar.write(f"記録期間: {filtered_df['日時'].min().strftime('%Y-%m-%d')} ～ {filtered_df['日時'].max().strftime('%Y-%m-%d')}")
+    if stats['count'] > 0:
+        st.sidebar.write(f"記録期間: {stats['first_date'].strftime('%Y-%m-%d')} ～ {stats['last_date'].strftime('%Y-%m-%d')}")
         
         # 締め年月の範囲
-        unique_months = sorted(filtered_df['年月'].unique())
+        unique_months = stats['months']
         if len(unique_months) > 0:
             start_month = unique_months[0]
             end_month = unique_months[-1]
-            start_display = f"{start_month[:4]}年{start_month[4:6]}月"
-            end_display = f"{end_month[:4]}年{end_month[4:6]}月"
+            start_display = format_year_month(start_month)
+            end_display = format_year_month(end_month)
             st.sidebar.write(f"締め年月: {start_display} ～ {end_display}")
             st.sidebar.write(f"対象月数: {len(unique_months)} ヶ月")
     
@@ -590,6 +865,7 @@ def main():
     
     # データ更新ボタン
     if st.sidebar.button("🔄 データを更新"):
+        load_data.clear()
         st.cache_data.clear()
         st.rerun()
     
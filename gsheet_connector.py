@@ -35,9 +35,18 @@ class GSheetConnector:
             return True
             
         except Exception as e:
-            print(f"接続エラー: {e}")
+            self.report_error(f"接続エラー: {e}")
             return False
     
+    def report_error(self, message):
+        """
+        エラーメッセージを出力
+        
+        Args:
+            message (str): エラーメッセージ
+        """
+        print(message)
+    
     def open_spreadsheet(self, spreadsheet_url):
         """
         スプレッドシートを開く
@@ -53,7 +62,7 @@ class GSheetConnector:
             return True
             
         except Exception as e:
-            print(f"スプレッドシートを開く際のエラー: {e}")
+            self.report_error(f"スプレッドシートを開く際のエラー: {e}")
             return False
     
     def select_worksheet(self, worksheet_name='kodukai-db'):
@@ -69,28 +78,38 @@ class GSheetConnector:
             return True
             
         except Exception as e:
-            print(f"ワークシートを選択する際のエラー: {e}")
+            self.report_error(f"ワークシートを選択する際のエラー: {e}")
             return False
     
-    def get_data_as_dataframe(self):
+    def get_data_as_dataframe(self, range_name=None):
         """
         ワークシートのデータをPandas DataFrameとして取得
         
+        Args:
+            range_name (str): 取得する範囲（例: 'A:D'）。Noneの場合はシート全体
+        
         Returns:
             pd.DataFrame: スプレッドシートのデータ
         """
         try:
-            # 全データを取得
-            data = self.worksheet.get_all_records()
+            # データを2次元リストとして取得（1行目はヘッダー）
+            # get_all_records()のような行ごとのdict生成を行わず、そのままDataFrameにする
+            if range_name:
+                # 必要な列だけをAPI側で切り出して取得する
+                values = self.worksheet.get_values(range_name)
+            else:
+                values = self.worksheet.get_all_values()
+            if not values:
+                return pd.DataFrame()
             
             # DataFrameに変換
-            df = pd.DataFrame(data)
+            df = pd.DataFrame(values[1:], columns=values[0])
             
             print(f"データを取得しました: {len(df)} 行, {len(df.columns)} 列")
             return df
             
         except Exception as e:
-            print(f"データ取得エラー: {e}")
+            self.report_error(f"データ取得エラー: {e}")
             return pd.DataFrame()
     
     def get_worksheet_info(self):
@@ -1,17 +1,18 @@
 import gspread
-import pandas as pd
 import streamlit as st
 from google.oauth2.service_account import Credentials
-import json
 
-class GSheetConnectorCloud:
+from gsheet_connector import GSheetConnector
+
+class GSheetConnectorCloud(GSheetConnector):
     def __init__(self):
         """
         Streamlit Cloud用のGoogle Sheets APIコネクター
+        
+        スプレッドシート操作はGSheetConnectorと共通で、認証情報の取得元と
+        エラーの表示先（st.error）だけが異なる
         """
-        self.client = None
-        self.spreadsheet = None
-        self.worksheet = None
+        super().__init__(credentials_file=None)
         
     def connect(self):
         """Google Sheets APIに接続（Streamlit Cloud用）"""
@@ -38,70 +39,14 @@ class GSheetConnectorCloud:
                 return False
                 
         except Exception as e:
-            st.error(f"接続エラー: {e}")
-            return False
-    
-    def open_spreadsheet(self, spreadsheet_url):
-        """
-        スプレッドシートを開く
-        
-        Args:
-            spreadsheet_url (str): スプレッドシートのURL
-        """
-        try:
-            # URLからスプレッドシートIDを抽出
-            spreadsheet_id = spreadsheet_url.split('/d/')[1].split('/')[0]
-            self.spreadsheet = self.client.open_by_key(spreadsheet_id)
-            print(f"スプレッドシート '{self.spreadsheet.title}' を開きました")
-            return True
-            
-        except Exception as e:
-            st.error(f"スプレッドシートを開く際のエラー: {e}")
+            self.report_error(f"接続エラー: {e}")
             return False
     
-    def select_worksheet(self, worksheet_name='kodukai-db'):
+    def report_error(self, message):
         """
-        ワークシートを選択
+        エラーメッセージをStreamlitの画面に表示
         
         Args:
-            worksheet_name (str): ワークシート名
+            message (str): エラーメッセージ
         """
-        try:
-            self.worksheet = self.spreadsheet.worksheet(worksheet_name)
-            print(f"ワークシート '{worksheet_name}' を選択しました")
-            return True
-            
-        except Exception as e:
-            st.error(f"ワークシートを選択する際のエラー: {e}")
-            return False
-    
-    def get_data_as_dataframe(self):
-        """
-        ワークシートのデータをPandas DataFrameとして取得
-        
-        Returns:
-            pd.DataFrame: スプレッドシートのデータ
-        """
-        try:
-            # 全データを取得
-            data = self.worksheet.get_all_records()
-            
-            # DataFrameに変換
-            df = pd.DataFrame(data)
-            
-            print(f"データを取得しました: {len(df)} 行, {len(df.columns)} 列")
-            return df
-            
-        except Exception as e:
-            st.error(f"データ取得エラー: {e}")
-            return pd.DataFrame()
-    
-    def get_worksheet_info(self):
-        """ワークシートの基本情報を取得"""
-        if self.worksheet:
-            return {
-                'title': self.worksheet.title,
-                'row_count': self.worksheet.row_count,
-                'col_count': self.worksheet.col_count
-            }
-        return None
+        st.error(message)